@@ -65,7 +65,7 @@ function ActiveFilters({ filters, onRemove, onClearAll }) {
 }
 
 export default function App() {
-  const { aggregated, detailed, geoData, produtoMap, geoMap, loading, error, loadDetailedData, loadGeoData } = useData();
+  const { aggregated, detailed, geoData, produtoMap, geoMap, breaks, breaksFailed, loading, error, loadDetailedData, loadGeoData, loadBreaksData } = useData();
 
   // Dropdown filters state (kept for period and region hierarchy)
   const [filters, setFilters] = useState({
@@ -198,15 +198,18 @@ export default function App() {
     }
   }, [aggregated, detailed, needsDetailed, loadDetailedData]);
 
-  // Lazy load geo data when map tab is activated
+  // Lazy load geo data and class breaks when map tab is activated
   useEffect(() => {
     if (activeTab === 'mapa' && !geoData) {
       loadGeoData();
     }
-  }, [activeTab, geoData, loadGeoData]);
+    if (activeTab === 'mapa' && !breaks && !breaksFailed) {
+      loadBreaksData();
+    }
+  }, [activeTab, geoData, loadGeoData, breaks, breaksFailed, loadBreaksData]);
 
   // Filter data using merged filters
-  const filteredData = useFilteredData(aggregated, detailed, geoMap, mergedFilters);
+  const filteredData = useFilteredData(aggregated, detailed, geoMap, mergedFilters, breaks);
 
   if (loading) {
     return <Loading />;
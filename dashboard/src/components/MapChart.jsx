@@ -32,6 +32,13 @@ export default function MapChart({ data, geoData, metric = 'valor', onMunicipioC
     };
   }, [data, selectedMetric]);
 
+  // Quebras naturais (Jenks) pré-calculadas pelo pipeline para a fatia atual;
+  // evitam que outliers achatem a paleta. Ausentes, vale a escala linear.
+  const classBreaks = useMemo(
+    () => data?.mapBreaks?.[selectedMetric]?.j || null,
+    [data, selectedMetric]
+  );
+
   // Gradientes sequenciais de matiz único (luminância monotônica, seguros
   // para daltônicos). A rampa de "valor" misturava verdes e azuis.
   const metricGradients = useMemo(() => ({
@@ -109,10 +116,26 @@ export default function MapChart({ data, geoData, metric = 'valor', onMunicipioC
       const getColor = (value) => {
         if (!value || value === 0) return '#f3f4f6';
 
+        const colors = metricGradients[selectedMetric];
+        if (classBreaks && classBreaks.length > 0) {
+          const last = colors.length - 1;
+          if (classBreaks.length < colors.length + 1) {
+            // Fatia com até 7 municípios: classBreaks traz os próprios valores
+            // (uma classe cada); espalhar pela rampa até a cor mais escura
+            let index = classBreaks.findIndex(limit => value <= limit);
+            if (index === -1) index = classBreaks.length - 1;
+            if (classBreaks.length === 1) return colors[last];
+            return colors[Math.round(index * last / (classBreaks.length - 1))];
+          }
+          // classBreaks = [mín, limite superior das classes..., máx]
+          const upper = classBreaks.slice(1, -1);
+          const index = upper.findIndex(limit => value <= limit);
+          return colors[index === -1 ? last : Math.min(index, last)];
+        }
+
         // maxVal === minVal (município único filtrado) dividiria por zero
         const range = maxVal - minVal || 1;
         const normalized = (value - minVal) / range;
-        const colors = metricGradients[selectedMetric];
 
         const index = Math.min(Math.floor(normalized * colors.length), colors.length - 1);
         return colors[index];
@@ -199,7 +222,7 @@ export default function MapChart({ data, geoData, metric = 'valor', onMunicipioC
 
       layerRef.current = geoLayer;
     });
-  }, [geoData, municipioData, selectedMetric, minVal, maxVal, metricGradients, selectedMunicipio, onMunicipioClick, mapReady]);
+  }, [geoData, municipioData, selectedMetric, minVal, maxVal, classBreaks, metricGradients, selectedMunicipio, onMunicipioClick, mapReady]);
 
   // Configuração das métricas com cores
   const metricConfig = {
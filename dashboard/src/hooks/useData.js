@@ -4,9 +4,19 @@ import { feature } from 'topojson-client';
 const BASE_PATH = import.meta.env.BASE_URL || '/vbp-parana/';
 const TOPO_URL = 'https://cdn.jsdelivr.net/gh/datageoparana/datageoparana.github.io@main/assets/parana-municipalities.topojson';
 
+/**
+ * URL de um artefato de dados. O manifest.json (gerado pelo pipeline) aponta
+ * para arquivos versionados pelo conteúdo (<nome>.<hash>.json), que podem
+ * ficar em cache indefinidamente; sem manifesto, usa o nome fixo legado.
+ */
+function artifactUrl(manifest, name) {
+  const file = manifest?.artifacts?.[name]?.file || `${name}.json`;
+  return `${BASE_PATH}data/${file}`;
+}
+
 /**
  * Hook para carregar e gerenciar os dados do dashboard
- * Implementa lazy loading para arquivos grandes (detailed.json e municipios.geojson)
+ * Implementa lazy loading para arquivos grandes (detailed.json, breaks.json e municipios.geojson)
  */
 export function useData() {
   const [aggregated, setAggregated] = useState(null);
@@ -14,9 +24,13 @@ export function useData() {
   const [geoData, setGeoData] = useState(null);
   const [produtoMap, setProdutoMap] = useState(null);
   const [geoMap, setGeoMap] = useState(null);
+  const [breaks, setBreaks] = useState(null);
+  const [manifest, setManifest] = useState(null);
   const [loading, setLoading] = useState(true);
   const [isDetailedLoading, setIsDetailedLoading] = useState(false);
   const [isGeoLoading, setIsGeoLoading] = useState(false);
+  const [isBreaksLoading, setIsBreaksLoading] = useState(false);
+  const [breaksFailed, setBreaksFailed] = useState(false);
   const [error, setError] = useState(null);
 
   // Carregar dados essenciais na inicialização (aggregated, produto_map, geo_map)
@@ -28,10 +42,18 @@ export function useData() {
       try {
         setLoading(true);
 
+        // Só o manifesto é revalidado a cada visita; os artefatos têm hash no nome
+        const manifestRes = await fetch(`${BASE_PATH}data/manifest.json`, { signal, cache: 'no-cache' })
+          .catch(err => {
+            if (err.name === 'AbortError') throw err;
+            return null;
+          });
+        const manifestData = manifestRes?.ok ? await manifestRes.json() : null;
+
         const [aggRes, prodMapRes, geoMapRes] = await Promise.all([
-          fetch(`${BASE_PATH}data/aggregated.json`, { signal }),
-          fetch(`${BASE_PATH}data/produto_map.json`, { signal }),
-          fetch(`${BASE_PATH}data/geo_map.json`, { signal }),
+          fetch(artifactUrl(manifestData, 'aggregated'), { signal }),
+          fetch(artifactUrl(manifestData, 'produto_map'), { signal }),
+          fetch(artifactUrl(manifestData, 'geo_map'), { signal }),
         ]);
 
         if (!aggRes.ok) {
@@ -45,6 +67,7 @@ export function useData() {
         ]);
 
         if (!signal.aborted) {
+          setManifest(manifestData);
           setAggregated(aggData);
           setProdutoMap(prodMapData);
           setGeoMap(geoMapData);
@@ -72,7 +95,7 @@ export function useData() {
     const controller = new AbortController();
     try {
       setIsDetailedLoading(true);
-      const res = await fetch(`${BASE_PATH}data/detailed.json`, { signal: controller.signal });
+      const res = await fetch(artifactUrl(manifest, 'detailed'), { signal: controller.signal });
       if (!res.ok) throw new Error('Erro ao carregar dados detalhados');
       const data = await res.json();
       if (!controller.signal.aborted) {
@@ -87,7 +110,7 @@ export function useData() {
         setIsDetailedLoading(false);
       }
     }
-  }, [detailed, isDetailedLoading]);
+  }, [detailed, isDetailedLoading, manifest]);
 
   // Função para carregar municipios.geojson sob demanda (48MB)
   const loadGeoData = useCallback(async () => {
@@ -114,18 +137,48 @@ export function useData() {
     }
   }, [geoData, isGeoLoading]);
 
+  // Função para carregar breaks.json sob demanda (quebras de classe do mapa)
+  // Falha silenciosa: sem as quebras o mapa volta à escala linear min/max.
+  // A falha é terminal (breaksFailed) para não repetir o fetch a cada render.
+  const loadBreaksData = useCallback(async () => {
+    if (breaks || isBreaksLoading || breaksFailed) return;
+
+    const controller = new AbortController();
+    try {
+      setIsBreaksLoading(true);
+      const res = await fetch(artifactUrl(manifest, 'breaks'), { signal: controller.signal });
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const data = await res.json();
+      if (!controller.signal.aborted) {
+        setBreaks(data);
+      }
+    } catch (err) {
+      if (err.name !== 'AbortError') {
+        console.warn('Quebras de classe indisponíveis:', err.message);
+        setBreaksFailed(true);
+      }
+    } finally {
+      if (!controller.signal.aborted) {
+        setIsBreaksLoading(false);
+      }
+    }
+  }, [breaks, isBreaksLoading, breaksFailed, manifest]);
+
   return {
     aggregated,
     detailed,
     geoData,
     produtoMap,
     geoMap,
+    breaks,
+    breaksFailed,
     loading,
     isDetailedLoading,
     isGeoLoading,
     error,
     loadDetailedData,
     loadGeoData,
+    loadBreaksData,
   };
 }
 
@@ -133,7 +186,7 @@ export function useData() {
  * Hook para filtrar dados com base nas seleções
  * Usa dataset cruzado (byAnoProdutoRegional) para aplicar TODOS os filtros em TODOS os visuais
  */
-export function useFilteredData(aggregated, detailed, geoMap, filters) {
+export function useFilteredData(aggregated, detailed, geoMap, filters, breaks = null) {
   return useMemo(() => {
     if (!aggregated) return null;
 
@@ -409,6 +462,22 @@ export function useFilteredData(aggregated, detailed, geoMap, filters) {
       });
     }
 
+    // === QUEBRAS DE CLASSE DO MAPA ===
+    // Pré-calculadas pelo pipeline para um ano (ou todos os anos) e no máximo
+    // um produto ou uma cadeia; demais combinações usam a escala linear do mapa.
+    // Filtros geográficos não mudam a fatia: as quebras são estaduais.
+    let mapBreaks = null;
+    if (breaks) {
+      const anoKey = anoMin === anoMax ? String(anoMin) : (hasYearFilter ? null : '*');
+      if (anoKey && hasProdutoFilter && produtos.length === 1) {
+        mapBreaks = breaks.produto?.[`${anoKey}|${produtos[0]}`] || null;
+      } else if (anoKey && !hasProdutoFilter && !hasSubcadeiaFilter && cadeias.length === 1) {
+        mapBreaks = breaks.cadeia?.[`${anoKey}|${cadeias[0]}`] || null;
+      } else if (anoKey && !hasProdutoFilterAny) {
+        mapBreaks = breaks.geral?.[anoKey] || null;
+      }
+    }
+
     // === HIERARCHY para treemap ===
     let hierarchy;
     if (hasAnyFilter && useDetailed) {
@@ -481,10 +550,11 @@ export function useFilteredData(aggregated, detailed, geoMap, filters) {
       byProduto,
       byRegional,
       byMunicipio: Object.values(mapByMunicipio),
+      mapBreaks,
       byMeso,
       evolutionCadeia,
       topProdutosAno,
       hierarchy,
     };
-  }, [aggregated, detailed, geoMap, filters]);
+  }, [aggregated, detailed, geoMap, filters, breaks]);
 }
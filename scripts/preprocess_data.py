@@ -16,11 +16,16 @@ Isso evita somar produções de diferentes unidades de medida (ex: toneladas + l
 garantindo valores consistentes nos agregados e visualizações.
 """
 
+import argparse
+import hashlib
+import inspect
 import json
 import re
+import shutil
+import time
 import unicodedata
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
 import pandas as pd
 import numpy as np
 
@@ -28,6 +33,9 @@ import numpy as np
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "dashboard" / "public" / "data"
+SNAPSHOT_DIR = BASE_DIR / ".cache" / "vbp_snapshot"
+ANOMALY_REPORT = DATA_DIR / "anomalias_vbp.csv"
+MANIFEST_FILE = "manifest.json"
 
 # Garantir que o diretório de saída existe
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -348,6 +356,378 @@ def load_all_vbp_data() -> pd.DataFrame:
     return data
 
 
+# Snapshot colunar da tabela fato (um .npy por coluna, aberto via memory-map).
+# SNAPSHOT_VERSION cobre o formato do snapshot; mudanças na normalização são
+# detectadas pelo hash de normalization_fingerprint().
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = "header.json"
+SNAPSHOT_GENERATION_PREFIX = "colunas-"
+
+# Esquema: colunas numéricas com dtype fixo; colunas de texto viram códigos int32 + dicionário
+SNAPSHOT_NUMERIC_COLUMNS: Dict[str, str] = {
+    "ano": "int64",
+    "valor": "float64",
+    "area": "float64",
+    "producao": "float64",
+    "producao_ton": "float64",
+}
+SNAPSHOT_TEXT_COLUMNS: List[str] = [
+    "municipio", "municipio_oficial", "cod_ibge", "regional_idr", "meso_idr",
+    "produto", "produto_conciso", "cadeia", "subcadeia", "unidade",
+]
+
+
+def source_fingerprint() -> str:
+    """Calcula hash SHA-256 das planilhas de origem (nome + conteúdo)."""
+    digest = hashlib.sha256()
+    for path in sorted(DATA_DIR.glob("*.xlsx"), key=lambda f: f.name):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def normalization_fingerprint() -> str:
+    """Calcula hash SHA-256 do código e das tabelas usados por load_all_vbp_data."""
+    digest = hashlib.sha256()
+    for func in (normalize_text, normalize_column, convert_to_tons, build_product_correction_map,
+                 coerce_year, load_reference_tables, rename_columns, process_vbp_file,
+                 load_all_vbp_data):
+        digest.update(inspect.getsource(func).encode("utf-8"))
+    for table in (COLUMN_ALIASES, MUNICIPIO_ALIASES, PRODUCT_ALIASES, UNIT_TO_TON_CONVERSION):
+        digest.update(json.dumps(table, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def snapshot_schema() -> Dict[str, str]:
+    """Esquema esperado do snapshot (coluna -> dtype armazenado)."""
+    schema = {col: "text" for col in SNAPSHOT_TEXT_COLUMNS}
+    schema.update(SNAPSHOT_NUMERIC_COLUMNS)
+    return schema
+
+
+def save_snapshot(data: pd.DataFrame, snapshot_dir: Path = SNAPSHOT_DIR) -> Path:
+    """
+    Salva a tabela fato limpa como conjunto de colunas .npy com cabeçalho de versão.
+
+    Colunas de texto são codificadas como códigos int32 e os dicionários
+    (valores distintos) vão para o cabeçalho JSON. Cada gravação cria uma nova
+    geração (subdiretório colunas-<n>) e só então troca o header.json de forma
+    atômica; arquivos já mapeados por outros processos nunca são reescritos.
+    A geração anterior é mantida para leitores que ainda leram o cabeçalho
+    antigo; as mais velhas são removidas.
+
+    Returns:
+        Caminho do diretório do snapshot
+    """
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    header_path = snapshot_dir / SNAPSHOT_HEADER
+
+    previous = None
+    if header_path.exists():
+        try:
+            with open(header_path, "r", encoding="utf-8") as f:
+                previous = json.load(f).get("columns")
+        except (OSError, ValueError):
+            previous = None
+
+    generation = f"{SNAPSHOT_GENERATION_PREFIX}{time.time_ns()}"
+    columns_dir = snapshot_dir / generation
+    columns_dir.mkdir()
+
+    dictionaries: Dict[str, List[str]] = {}
+    for col in SNAPSHOT_TEXT_COLUMNS:
+        codes, uniques = pd.factorize(data[col], sort=True)
+        np.save(columns_dir / f"{col}.npy", codes.astype(np.int32))
+        dictionaries[col] = [str(v) for v in uniques]
+
+    for col, dtype in SNAPSHOT_NUMERIC_COLUMNS.items():
+        np.save(columns_dir / f"{col}.npy", data[col].to_numpy(dtype=dtype))
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "columns": generation,
+        "schema": snapshot_schema(),
+        "rows": int(len(data)),
+        "sources": source_fingerprint(),
+        "normalization": normalization_fingerprint(),
+        "dictionaries": dictionaries,
+    }
+    tmp_path = header_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    tmp_path.replace(header_path)
+
+    # Remover gerações antigas e colunas soltas do formato v1; em POSIX o
+    # unlink não afeta quem já tem o arquivo mapeado
+    for path in snapshot_dir.iterdir():
+        if path.is_dir() and path.name.startswith(SNAPSHOT_GENERATION_PREFIX):
+            if path.name not in (generation, previous):
+                shutil.rmtree(path, ignore_errors=True)
+        elif path.suffix == ".npy":
+            path.unlink(missing_ok=True)
+
+    return snapshot_dir
+
+
+def load_snapshot(snapshot_dir: Path = SNAPSHOT_DIR,
+                  check_sources: bool = True) -> Optional[pd.DataFrame]:
+    """
+    Abre o snapshot da tabela fato via memory-map.
+
+    Colunas numéricas são mapeadas diretamente do disco (sem cópia, páginas
+    compartilhadas entre processos); colunas de texto são decodificadas dos
+    dicionários para object, com os mesmos dtypes de load_all_vbp_data.
+
+    Args:
+        snapshot_dir: Diretório gerado por save_snapshot
+        check_sources: Se True, rejeita o snapshot quando as planilhas mudaram
+
+    Returns:
+        DataFrame com as colunas de load_all_vbp_data, ou None se o snapshot
+        não existir ou estiver desatualizado
+    """
+    header_path = snapshot_dir / SNAPSHOT_HEADER
+    if not header_path.exists():
+        return None
+
+    with open(header_path, "r", encoding="utf-8") as f:
+        header = json.load(f)
+
+    if header.get("version") != SNAPSHOT_VERSION or header.get("schema") != snapshot_schema():
+        print(f"AVISO: snapshot em {snapshot_dir} com versão/esquema desatualizado; ignorando")
+        return None
+    if header.get("normalization") != normalization_fingerprint():
+        print(f"AVISO: normalização alterada desde o snapshot em {snapshot_dir}; ignorando")
+        return None
+    if check_sources and header.get("sources") != source_fingerprint():
+        print(f"AVISO: planilhas alteradas desde o snapshot em {snapshot_dir}; ignorando")
+        return None
+
+    rows = header["rows"]
+    columns_dir = snapshot_dir / header["columns"]
+    columns: Dict[str, Any] = {}
+    try:
+        for col in SNAPSHOT_TEXT_COLUMNS:
+            codes = np.load(columns_dir / f"{col}.npy", mmap_mode="r")
+            # Código -1 (valor ausente no factorize) aponta para o NaN no fim do dicionário
+            dictionary = np.array(header["dictionaries"][col] + [np.nan], dtype=object)
+            columns[col] = dictionary[codes]
+        for col in SNAPSHOT_NUMERIC_COLUMNS:
+            columns[col] = np.load(columns_dir / f"{col}.npy", mmap_mode="r")
+    except FileNotFoundError:
+        print(f"AVISO: snapshot em {snapshot_dir} substituído durante a leitura; ignorando")
+        return None
+
+    if any(len(values) != rows for values in columns.values()):
+        print(f"AVISO: snapshot em {snapshot_dir} incompleto; ignorando")
+        return None
+
+    required_cols = ["ano", "municipio", "municipio_oficial", "cod_ibge", "regional_idr",
+                     "meso_idr", "produto", "produto_conciso", "cadeia", "subcadeia",
+                     "unidade", "valor", "area", "producao", "producao_ton"]
+    return pd.DataFrame({col: columns[col] for col in required_cols}, copy=False)
+
+
+# Detecção de anomalias (produtividade implausível)
+# z robusto de Iglewicz-Hoaglin: 0.6745 * (x - mediana) / MAD, calculado em log10
+# para que erros multiplicativos (KG lançado como TON, vírgula deslocada) fiquem simétricos.
+ANOMALY_Z_THRESHOLD = 3.5
+ANOMALY_MIN_GROUP = 5       # observações mínimas para estimar mediana/MAD
+# Piso do MAD em log10: com o limiar de 3.5, nenhum desvio menor que
+# 3.5 * 0.17 / 0.6745 ≈ 0.88 (~7.6×) é sinalizado, e um erro de uma casa
+# decimal (10×, 1.0 em log10) atinge z ≈ 3.97. O alvo são erros de unidade ou
+# de casa decimal, não a dispersão de culturas pequenas arredondadas a 0.1 t.
+ANOMALY_MAD_FLOOR = 0.17
+ANOMALY_POLICIES = ("flag", "exclude", "clip")
+
+
+def grouped_median(values: np.ndarray, group_ids: np.ndarray,
+                   n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mediana por grupo com uma única ordenação (sem loop Python por grupo).
+
+    Args:
+        values: Valores finitos
+        group_ids: Código do grupo de cada valor (0..n_groups-1)
+        n_groups: Total de grupos
+
+    Returns:
+        Tupla (mediana por grupo, contagem por grupo); grupos vazios têm mediana NaN
+    """
+    order = np.lexsort((values, group_ids))
+    sorted_values = values[order]
+    counts = np.bincount(group_ids, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+
+    medians = np.full(n_groups, np.nan)
+    filled = counts > 0
+    lo = starts[filled] + (counts[filled] - 1) // 2
+    hi = starts[filled] + counts[filled] // 2
+    medians[filled] = (sorted_values[lo] + sorted_values[hi]) / 2
+    return medians, counts
+
+
+def grouped_robust_z(values: np.ndarray, group_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula z-score robusto (mediana/MAD) de cada valor dentro do seu grupo.
+
+    Returns:
+        Tupla (z por valor, mediana do grupo por valor); NaN onde o valor não é
+        finito ou o grupo tem menos de ANOMALY_MIN_GROUP observações
+    """
+    z = np.full(len(values), np.nan)
+    center = np.full(len(values), np.nan)
+    valid = np.isfinite(values)
+    if not valid.any():
+        return z, center
+
+    groups, codes = np.unique(group_ids[valid], return_inverse=True)
+    x = values[valid]
+    medians, counts = grouped_median(x, codes, len(groups))
+    mad, _ = grouped_median(np.abs(x - medians[codes]), codes, len(groups))
+    scale = np.maximum(mad, ANOMALY_MAD_FLOOR)
+
+    z_valid = 0.6745 * (x - medians[codes]) / scale[codes]
+    z_valid[counts[codes] < ANOMALY_MIN_GROUP] = np.nan
+    z[valid] = z_valid
+    center[valid] = medians[codes]
+    return z, center
+
+
+def detect_anomalies(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sinaliza produtividades implausíveis por município × produto × ano.
+
+    Calcula rendimento (t/ha) e preço implícito (R$/t) e compara cada
+    observação (a) com o mesmo produto no mesmo ano em todos os municípios e
+    (b) com a própria série histórica do município × produto, descontada a
+    mediana estadual de cada ano.
+
+    Returns:
+        Relatório ordenado por score decrescente, apenas com linhas sinalizadas
+    """
+    keys = ["ano", "cod_ibge", "municipio_oficial", "produto_conciso"]
+    obs = data.groupby(keys, sort=False).agg({
+        "unidade": "first",
+        "valor": "sum",
+        "producao_ton": "sum",
+        "area": "sum"
+    }).reset_index()
+
+    valor = obs["valor"].to_numpy(dtype=float)
+    producao = obs["producao_ton"].to_numpy(dtype=float)
+    area = obs["area"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rendimento = np.where((producao > 0) & (area > 0), producao / area, np.nan)
+        preco = np.where((valor > 0) & (producao > 0), valor / producao, np.nan)
+    obs["rendimento"] = rendimento
+    obs["preco"] = preco
+
+    produto_ano = obs.groupby(["produto_conciso", "ano"], sort=False).ngroup().to_numpy()
+    serie = obs.groupby(["cod_ibge", "municipio_oficial", "produto_conciso"], sort=False).ngroup().to_numpy()
+
+    scores = []
+    for metric, values in (("rend", rendimento), ("preco", preco)):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_values = np.log10(values)
+        z_produto, med_produto = grouped_robust_z(log_values, produto_ano)
+        # Série histórica sobre o resíduo frente à mediana do produto no ano:
+        # choques comuns a todo o estado (preço, inflação, seca) se cancelam
+        z_serie, _ = grouped_robust_z(log_values - med_produto, serie)
+        obs[f"z_{metric}_produto"] = z_produto
+        obs[f"z_{metric}_serie"] = z_serie
+        obs[f"{metric}_mediana"] = 10 ** med_produto
+        scores.extend([z_produto, z_serie])
+
+    score = np.abs(np.column_stack(scores))
+    score = np.where(np.isnan(score), 0.0, score).max(axis=1)
+    obs["score"] = score
+
+    report = obs[score > ANOMALY_Z_THRESHOLD]
+    return report.sort_values("score", ascending=False).reset_index(drop=True)
+
+
+def apply_anomaly_policy(data: pd.DataFrame, anomalies: pd.DataFrame,
+                         policy: str = "flag") -> pd.DataFrame:
+    """
+    Aplica a política escolhida às linhas sinalizadas antes da agregação.
+
+    Args:
+        data: Tabela fato limpa
+        anomalies: Relatório gerado por detect_anomalies
+        policy: "flag" (apenas relatório), "exclude" (remove as linhas) ou
+            "clip" (corrige a coluna suspeita para a mediana do produto no ano)
+
+    No "clip", a coluna corrigida depende da combinação de sinais:
+    rendimento alto e preço baixo (ou o inverso) indicam produção errada;
+    só o rendimento fora do padrão indica área errada; só o preço, valor
+    errado. O resultado é conferido com uma nova detecção.
+
+    Returns:
+        Tabela fato após a política
+
+    Raises:
+        RuntimeError: se o "clip" gerar mais anomalias do que corrigiu
+    """
+    if policy not in ANOMALY_POLICIES:
+        raise ValueError(f"Política de anomalias inválida: {policy!r} (use {', '.join(ANOMALY_POLICIES)})")
+    if policy == "flag" or anomalies.empty:
+        return data
+
+    keys = ["ano", "cod_ibge", "municipio_oficial", "produto_conciso"]
+    flagged = anomalies[keys].copy()
+
+    if policy == "exclude":
+        flagged["_anomalia"] = True
+        merged = data.merge(flagged, on=keys, how="left")
+        return data[merged["_anomalia"].isna().to_numpy()].reset_index(drop=True)
+
+    def strongest(cols: List[str]) -> pd.Series:
+        """z de maior módulo entre os contextos (produto no ano, série)."""
+        z = anomalies[cols].to_numpy()
+        pick = np.nanargmax(np.where(np.isnan(z), -1.0, np.abs(z)), axis=1)
+        return pd.Series(z[np.arange(len(z)), pick], index=anomalies.index).fillna(0.0)
+
+    z_rend = strongest(["z_rend_produto", "z_rend_serie"])
+    z_preco = strongest(["z_preco_produto", "z_preco_serie"])
+    rend_flag = z_rend.abs() > ANOMALY_Z_THRESHOLD
+    preco_flag = z_preco.abs() > ANOMALY_Z_THRESHOLD
+
+    # Sinais opostos: a produção desloca rendimento e preço juntos (ex.: KG lançado como TON)
+    producao_errada = rend_flag & preco_flag & (np.sign(z_rend) != np.sign(z_preco))
+    area_errada = rend_flag & ~producao_errada
+    valor_errado = preco_flag & ~producao_errada
+
+    flagged["_fator_producao"] = np.where(
+        producao_errada, anomalies["rend_mediana"] / anomalies["rendimento"], 1.0
+    )
+    flagged["_fator_area"] = np.where(
+        area_errada, anomalies["rendimento"] / anomalies["rend_mediana"], 1.0
+    )
+    flagged["_fator_valor"] = np.where(
+        valor_errado, anomalies["preco_mediana"] / anomalies["preco"], 1.0
+    )
+    fatores = ["_fator_producao", "_fator_area", "_fator_valor"]
+    for col in fatores:
+        flagged[col] = flagged[col].replace([np.inf, -np.inf], np.nan).fillna(1.0)
+
+    merged = data.merge(flagged, on=keys, how="left")
+    clipped = data.reset_index(drop=True).copy()
+    fator_producao, fator_area, fator_valor = (merged[col].fillna(1.0).to_numpy() for col in fatores)
+    clipped["producao"] = clipped["producao"] * fator_producao
+    clipped["producao_ton"] = clipped["producao_ton"] * fator_producao
+    clipped["area"] = clipped["area"] * fator_area
+    clipped["valor"] = clipped["valor"] * fator_valor
+
+    remaining = len(detect_anomalies(clipped))
+    if remaining > len(anomalies):
+        raise RuntimeError(
+            f"Política clip gerou novas anomalias ({len(anomalies):,} -> {remaining:,}); "
+            "use --anomalias flag ou exclude"
+        )
+    return clipped
+
+
 def generate_aggregated_data(data: pd.DataFrame) -> Dict[str, Any]:
     """Gera dados agregados para o dashboard."""
 
@@ -622,6 +1002,189 @@ def generate_detailed_data(data: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
+# Classes do mapa coroplético (mesmo número de cores das rampas do MapChart)
+BREAK_CLASSES = 7
+# Limite de células (grupos × n × n) por lote do Jenks vetorizado (~8 MB em float64)
+JENKS_BATCH_CELLS = 1_000_000
+BREAK_METRICS: Dict[str, str] = {"valor": "valor", "producao_ton": "producao", "area": "area"}
+
+
+def grouped_quantile_breaks(values: np.ndarray, group_ids: np.ndarray,
+                            n_groups: int, k: int = BREAK_CLASSES) -> np.ndarray:
+    """
+    Quebras por quantis (k classes) para todos os grupos de uma vez.
+
+    Returns:
+        Matriz (n_groups, k + 1) com mínimo, limites intermediários e máximo
+    """
+    order = np.lexsort((values, group_ids))
+    sorted_values = values[order]
+    counts = np.bincount(group_ids, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+
+    # Interpolação linear entre posições vizinhas (mesmo critério de np.quantile)
+    positions = (counts[:, None] - 1) * np.linspace(0, 1, k + 1)[None, :]
+    lo = np.floor(positions).astype(int)
+    hi = np.ceil(positions).astype(int)
+    frac = positions - lo
+    lo_values = sorted_values[starts[:, None] + lo]
+    hi_values = sorted_values[starts[:, None] + hi]
+    return lo_values + (hi_values - lo_values) * frac
+
+
+def _jenks_dp(x: np.ndarray, lengths: np.ndarray, k: int) -> np.ndarray:
+    """
+    Programação dinâmica de Fisher-Jenks para um lote de séries ordenadas.
+
+    Args:
+        x: Matriz (B, n) com valores ordenados; posições além de lengths[b]
+            são preenchimento e não afetam o resultado
+        lengths: Tamanho real de cada série (todos > k)
+        k: Número de classes
+
+    Returns:
+        Matriz (B, k + 1) com mínimo, limite superior das classes 1..k-1 e máximo
+    """
+    batch, n = x.shape
+    rows = np.arange(batch)
+    # Escala por série: evita cancelamento numérico em s2 - s1² com valores em R$ bilhões
+    scaled = x / x[:, -1:]
+    p1 = np.concatenate([np.zeros((batch, 1)), np.cumsum(scaled, axis=1)], axis=1)
+    p2 = np.concatenate([np.zeros((batch, 1)), np.cumsum(scaled * scaled, axis=1)], axis=1)
+
+    # ssd[b, i, m]: soma dos desvios quadráticos da classe que vai de m até i
+    end = np.arange(n)[:, None]
+    start = np.arange(n)[None, :]
+    valid = start <= end
+    size = np.where(valid, end - start + 1, 1)
+    s1 = p1[:, 1:, None] - p1[:, None, :-1]
+    ssd = p2[:, 1:, None] - p2[:, None, :-1]
+    ssd -= s1 * s1 / size
+    ssd[:, ~valid] = np.inf
+
+    cost = ssd[:, :, 0].copy()
+    back = np.zeros((k, batch, n), dtype=np.intp)
+    total = s1  # reaproveita o buffer (B, n, n)
+    for j in range(1, k):
+        prev = np.concatenate([np.full((batch, 1), np.inf), cost[:, :-1]], axis=1)
+        np.add(prev[:, None, :], ssd, out=total)
+        back[j] = np.argmin(total, axis=2)
+        cost = np.take_along_axis(total, back[j][:, :, None], axis=2)[:, :, 0]
+
+    breaks = np.empty((batch, k + 1))
+    last = lengths - 1
+    breaks[:, 0] = x[:, 0]
+    breaks[:, k] = x[rows, last]
+    for j in range(k - 1, 0, -1):
+        first = back[j][rows, last]
+        breaks[:, j] = x[rows, first - 1]
+        last = first - 1
+    return breaks
+
+
+def grouped_jenks_breaks(values: np.ndarray, group_ids: np.ndarray,
+                         n_groups: int, k: int = BREAK_CLASSES) -> np.ndarray:
+    """
+    Quebras naturais de Jenks (ótimo exato de Fisher) para todos os grupos.
+
+    Grupos de tamanho parecido são empilhados em lotes e resolvidos juntos
+    pela programação dinâmica vetorizada, O(k·n²) por grupo.
+
+    Returns:
+        Matriz (n_groups, k + 1); grupos com até k valores recebem os próprios
+        valores ordenados, completados com NaN
+    """
+    order = np.lexsort((values, group_ids))
+    sorted_values = values[order]
+    counts = np.bincount(group_ids, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    breaks = np.full((n_groups, k + 1), np.nan)
+
+    small = np.flatnonzero((counts > 0) & (counts <= k))
+    if len(small):
+        small_rows = np.repeat(small, counts[small])
+        small_cols = np.arange(len(small_rows)) - np.repeat(np.cumsum(counts[small]) - counts[small], counts[small])
+        breaks[small_rows, small_cols] = sorted_values[np.repeat(starts[small], counts[small]) + small_cols]
+
+    large = np.flatnonzero(counts > k)
+    large = large[np.argsort(counts[large], kind="stable")]
+    sizes = counts[large]
+    pos = 0
+    while pos < len(large):
+        # Lotes em ordem crescente de tamanho: o custo é dado pelo maior grupo do lote
+        stops = np.arange(pos + 1, len(large) + 1)
+        fits = sizes[stops - 1] ** 2 * (stops - pos) <= JENKS_BATCH_CELLS
+        stop = stops[fits].max() if fits.any() else pos + 1
+        batch = large[pos:stop]
+        lengths = counts[batch]
+        width = lengths.max()
+        idx = starts[batch][:, None] + np.minimum(np.arange(width)[None, :], lengths[:, None] - 1)
+        breaks[batch] = _jenks_dp(sorted_values[idx], lengths, k)
+        pos = stop
+
+    return breaks
+
+
+def generate_class_breaks(data: pd.DataFrame, k: int = BREAK_CLASSES) -> Dict[str, Any]:
+    """
+    Pré-calcula quebras de classe (quantis e Jenks) do mapa por fatia.
+
+    Fatias: (ano, produto), (ano, cadeia) e (ano) geral, cada uma também com
+    o acumulado de todos os anos (ano "*"). Os valores são os totais por
+    município de cada fatia, considerando apenas valores positivos, somados a
+    partir das mesmas linhas arredondadas que o dashboard recebe em
+    detailed.json (byAnoProdutoMunicipio para produto/cadeia, mapData para o
+    geral), para que as quebras cubram exatamente os valores exibidos.
+
+    Returns:
+        Tabela de consulta {"produto"|"cadeia"|"geral": {chave: {métrica: {"q": [...], "j": [...]}}}}
+    """
+    metrics = list(BREAK_METRICS)
+    # Mesmo agrupamento e arredondamento de generate_detailed_data
+    detailed_rows = {
+        "produto": ["ano", "produto_conciso", "cadeia", "subcadeia", "cod_ibge", "municipio_oficial", "regional_idr"],
+        "geral": ["ano", "cod_ibge", "municipio_oficial", "regional_idr"],
+    }
+    rows = {}
+    for name, keys in detailed_rows.items():
+        grouped = data.groupby(keys)[metrics].sum().round(0).reset_index()
+        rows[name] = grouped[grouped["cod_ibge"] != ""]
+
+    slices = []
+    for tipo, source, dim in (("produto", "produto", "produto_conciso"),
+                              ("cadeia", "produto", "cadeia"),
+                              ("geral", "geral", None)):
+        base = rows[source]
+        dims = [dim] if dim else []
+        by_year = base.groupby(["ano"] + dims + ["cod_ibge"])[metrics].sum().reset_index()
+        by_year["ano"] = by_year["ano"].astype(str)
+        all_years = base.groupby(dims + ["cod_ibge"])[metrics].sum().reset_index()
+        all_years["ano"] = "*"
+        frame = pd.concat([by_year, all_years], ignore_index=True)
+        frame["chave"] = frame["ano"] + "|" + frame[dim].astype(str) if dim else frame["ano"]
+        frame["tipo"] = tipo
+        slices.append(frame[["tipo", "chave"] + metrics])
+
+    long = pd.concat(slices, ignore_index=True).melt(
+        id_vars=["tipo", "chave"], value_vars=metrics, var_name="metrica", value_name="v"
+    )
+    long = long[long["v"] > 0]
+    group_ids, groups = pd.factorize(pd.MultiIndex.from_frame(long[["tipo", "chave", "metrica"]]))
+    values = long["v"].to_numpy(dtype=float)
+
+    quantiles = np.round(grouped_quantile_breaks(values, group_ids, len(groups), k), 2)
+    jenks = np.round(grouped_jenks_breaks(values, group_ids, len(groups), k), 2)
+
+    lookup: Dict[str, Any] = {"classes": k, "produto": {}, "cadeia": {}, "geral": {}}
+    for gid, (tipo, chave, metrica) in enumerate(groups):
+        entry = lookup[tipo].setdefault(chave, {})
+        entry[BREAK_METRICS[metrica]] = {
+            "q": quantiles[gid].tolist(),
+            "j": jenks[gid][~np.isnan(jenks[gid])].tolist(),
+        }
+    return lookup
+
+
 def generate_subcadeia_produto_map(data: pd.DataFrame) -> Dict[str, List[str]]:
     """Gera mapa de subcadeia -> produtos para filtros dinâmicos."""
     mapping = {}
@@ -669,6 +1232,73 @@ def generate_municipio_regional_map(data: pd.DataFrame) -> Dict[str, Any]:
     return by_meso
 
 
+# Artefatos publicados com nome versionado pelo conteúdo (<nome>.<hash>.json)
+# para cache imutável no navegador; só o manifest.json precisa ser revalidado.
+MANIFEST_VERSION = 1
+ARTIFACT_NAMES = ("aggregated", "detailed", "produto_map", "geo_map", "breaks")
+ARTIFACT_HASH_LENGTH = 16
+
+
+def write_artifact(name: str, payload: Any, rows: int,
+                   output_dir: Path = OUTPUT_DIR) -> Dict[str, Any]:
+    """
+    Grava um artefato JSON com o hash do conteúdo no nome do arquivo.
+
+    Conteúdo igual gera o mesmo nome, preservando o cache dos clientes entre
+    execuções. A gravação passa por um arquivo temporário, e um arquivo
+    existente só é reaproveitado se o conteúdo conferir com o hash do nome
+    (uma execução interrompida não publica um JSON truncado).
+
+    Returns:
+        Entrada do manifesto (arquivo, hash, bytes, linhas)
+    """
+    content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    digest = hashlib.sha256(content).hexdigest()[:ARTIFACT_HASH_LENGTH]
+    filename = f"{name}.{digest}.json"
+    path = output_dir / filename
+    if not path.exists() or hashlib.sha256(path.read_bytes()).hexdigest()[:ARTIFACT_HASH_LENGTH] != digest:
+        tmp_path = output_dir / f"{filename}.tmp"
+        tmp_path.write_bytes(content)
+        tmp_path.replace(path)
+
+    return {"file": filename, "hash": digest, "bytes": len(content), "rows": rows}
+
+
+def write_manifest(artifacts: Dict[str, Dict[str, Any]],
+                   output_dir: Path = OUTPUT_DIR) -> List[Path]:
+    """
+    Grava manifest.json e remove versões antigas dos artefatos.
+
+    São removidos os arquivos <nome>.<hash>.json fora do manifesto, os
+    nomes fixos legados (<nome>.json) e temporários (.tmp) de gravações
+    interrompidas.
+
+    Returns:
+        Arquivos removidos
+    """
+    manifest = {"version": MANIFEST_VERSION, "artifacts": artifacts}
+    tmp_path = output_dir / f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(output_dir / MANIFEST_FILE)
+
+    current = {entry["file"] for entry in artifacts.values()}
+    pattern = re.compile(
+        rf"^({'|'.join(ARTIFACT_NAMES)})(\.[0-9a-f]{{{ARTIFACT_HASH_LENGTH}}})?\.json(\.tmp)?$"
+    )
+    removed = []
+    for path in sorted(output_dir.glob("*.json*")):
+        if pattern.match(path.name) and path.name not in current:
+            path.unlink()
+            removed.append(path)
+    return removed
+
+
+def count_records(payload: Dict[str, Any]) -> int:
+    """Conta registros das tabelas (listas) de primeiro nível de um artefato."""
+    return sum(len(value) for value in payload.values() if isinstance(value, list))
+
+
 def copy_geojson():
     """Copia o GeoJSON para a pasta de dados do dashboard."""
     import shutil
@@ -701,7 +1331,7 @@ def copy_geojson():
     print(f"GeoJSON otimizado salvo em: {dst}")
 
 
-def main():
+def main(anomaly_policy: str = "flag"):
     """Função principal."""
     print("=" * 60)
     print("Preprocessamento de dados VBP Paraná")
@@ -713,36 +1343,62 @@ def main():
     print(f"   Total de registros: {len(data):,}")
     print(f"   Anos: {sorted(data['ano'].unique())}")
 
+    save_snapshot(data)
+    print(f"   Snapshot salvo em: {SNAPSHOT_DIR}")
+
+    # Verificar qualidade dos dados
+    print("\n2. Detectando anomalias de produtividade...")
+    anomalies = detect_anomalies(data)
+    anomalies.to_csv(ANOMALY_REPORT, index=False, encoding="utf-8")
+    print(f"   Observações sinalizadas: {len(anomalies):,} (salvo: {ANOMALY_REPORT.name})")
+    data = apply_anomaly_policy(data, anomalies, anomaly_policy)
+    print(f"   Política aplicada: {anomaly_policy}")
+
+    artifacts: Dict[str, Dict[str, Any]] = {}
+
     # Gerar dados agregados
-    print("\n2. Gerando dados agregados...")
+    print("\n3. Gerando dados agregados...")
     aggregated = generate_aggregated_data(data)
-
-    with open(OUTPUT_DIR / "aggregated.json", "w", encoding="utf-8") as f:
-        json.dump(aggregated, f, ensure_ascii=False)
-    print(f"   Salvo: aggregated.json")
+    artifacts["aggregated"] = write_artifact("aggregated", aggregated, count_records(aggregated))
+    print(f"   Salvo: {artifacts['aggregated']['file']}")
 
     # Gerar dados detalhados
-    print("\n3. Gerando dados detalhados...")
+    print("\n4. Gerando dados detalhados...")
     detailed = generate_detailed_data(data)
-
-    with open(OUTPUT_DIR / "detailed.json", "w", encoding="utf-8") as f:
-        json.dump(detailed, f, ensure_ascii=False)
-    print(f"   Salvo: detailed.json")
+    artifacts["detailed"] = write_artifact("detailed", detailed, count_records(detailed))
+    print(f"   Salvo: {artifacts['detailed']['file']}")
 
     # Gerar mapas de filtros
-    print("\n4. Gerando mapas de filtros...")
+    print("\n5. Gerando mapas de filtros...")
     produto_map = generate_subcadeia_produto_map(data)
-    with open(OUTPUT_DIR / "produto_map.json", "w", encoding="utf-8") as f:
-        json.dump(produto_map, f, ensure_ascii=False)
-    print(f"   Salvo: produto_map.json")
+    artifacts["produto_map"] = write_artifact(
+        "produto_map", produto_map,
+        sum(len(produtos) for item in produto_map.values() for produtos in item["produtos"].values())
+    )
+    print(f"   Salvo: {artifacts['produto_map']['file']}")
 
     geo_map = generate_municipio_regional_map(data)
-    with open(OUTPUT_DIR / "geo_map.json", "w", encoding="utf-8") as f:
-        json.dump(geo_map, f, ensure_ascii=False)
-    print(f"   Salvo: geo_map.json")
+    artifacts["geo_map"] = write_artifact(
+        "geo_map", geo_map,
+        sum(len(municipios) for item in geo_map.values() for municipios in item["municipios"].values())
+    )
+    print(f"   Salvo: {artifacts['geo_map']['file']}")
+
+    # Pré-calcular quebras de classe do mapa
+    print("\n6. Calculando quebras de classe do mapa...")
+    breaks = generate_class_breaks(data)
+    artifacts["breaks"] = write_artifact(
+        "breaks", breaks, sum(len(breaks[tipo]) for tipo in ("produto", "cadeia", "geral"))
+    )
+    print(f"   Salvo: {artifacts['breaks']['file']}")
+
+    # Manifesto e limpeza de versões antigas
+    print("\n7. Gravando manifesto...")
+    removed = write_manifest(artifacts)
+    print(f"   Salvo: {MANIFEST_FILE} ({len(removed)} arquivo(s) antigo(s) removido(s))")
 
     # Copiar GeoJSON
-    print("\n5. Processando GeoJSON...")
+    print("\n8. Processando GeoJSON...")
     # copy_geojson() removido: municipios.geojson (48 MB) era publicado no
     # Pages sem nenhum consumidor (o mapa usa o TopoJSON de 4,4 MB do hub).
 
@@ -762,4 +1418,10 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Preprocessamento de dados VBP Paraná")
+    parser.add_argument(
+        "--anomalias", choices=ANOMALY_POLICIES, default="flag",
+        help="tratamento das observações sinalizadas antes da agregação (padrão: flag)",
+    )
+    args = parser.parse_args()
+    main(anomaly_policy=args.anomalias)